@@ -0,0 +1,147 @@
+import heapq
+from array import array
+
+from polaris import ISSUE_SEVERITY_RANKS
+
+SEVERITIES = sorted(ISSUE_SEVERITY_RANKS, key=ISSUE_SEVERITY_RANKS.get)
+
+DIMENSIONS = ('project', 'severity', 'issue-kind', 'sub-tool')
+
+
+# Issue counts per project x severity x issue-kind x sub-tool, built in one
+# pass. Totals and severity counts are flat arrays (one row per project, one
+# column per severity); the full cube is a sparse dict keyed by codes.
+class IssueAggregation:
+    def __init__(self, normalized_projects):
+        width = len(SEVERITIES)
+
+        self.project_ids = []
+        self.project_names = []
+        self.issue_kinds = []
+        self.sub_tools = []
+        self.project_totals = array('L')
+        self.severity_counts = array('L')
+        self.cells = {}
+        self._rows = {}
+
+        kind_codes = {}
+        sub_tool_codes = {}
+        cells = self.cells
+
+        for row, project in enumerate(normalized_projects):
+            self._rows[project['project_id']] = row
+            self.project_ids.append(project['project_id'])
+            self.project_names.append(project['project_name'])
+            self.severity_counts.extend([0] * width)
+            base = row * width
+
+            issues = project['issues']
+            for issue in issues:
+                severity = ISSUE_SEVERITY_RANKS[issue['severity']]
+
+                kind = kind_codes.get(issue['issue-kind'])
+                if kind is None:
+                    kind = kind_codes[issue['issue-kind']] = len(
+                        self.issue_kinds
+                    )
+                    self.issue_kinds.append(issue['issue-kind'])
+
+                sub_tool = sub_tool_codes.get(issue['sub-tool'])
+                if sub_tool is None:
+                    sub_tool = sub_tool_codes[issue['sub-tool']] = len(
+                        self.sub_tools
+                    )
+                    self.sub_tools.append(issue['sub-tool'])
+
+                self.severity_counts[base + severity] += 1
+                key = (row, severity, kind, sub_tool)
+                cells[key] = cells.get(key, 0) + 1
+
+            self.project_totals.append(len(issues))
+
+        self.severity_totals = array('L', [0] * width)
+        for index, count in enumerate(self.severity_counts):
+            self.severity_totals[index % width] += count
+
+    def __len__(self):
+        return len(self.project_ids)
+
+    def IndexOf(self, project_id):
+        return self._rows.get(project_id)
+
+    def Total(self):
+        return sum(self.project_totals)
+
+    def SeverityCounts(self, row):
+        width = len(SEVERITIES)
+        counts = self.severity_counts[row * width:(row + 1) * width]
+        return {
+            severity: count
+            for severity, count in zip(SEVERITIES, counts)
+            if count > 0
+        }
+
+    def SeverityTotals(self):
+        return dict(zip(SEVERITIES, self.severity_totals))
+
+    def CountsBy(self, *dimensions):
+        for dimension in dimensions:
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"Unknown dimension '{dimension}'")
+
+        labels = (
+            self.project_ids, SEVERITIES, self.issue_kinds, self.sub_tools
+        )
+        positions = [DIMENSIONS.index(x) for x in dimensions]
+
+        counts = {}
+        for key, count in self.cells.items():
+            label = tuple(labels[i][key[i]] for i in positions)
+            counts[label] = counts.get(label, 0) + count
+        return counts
+
+    def TopProjects(self, n=10):
+        rows = heapq.nlargest(
+            n, range(len(self)), key=self.project_totals.__getitem__
+        )
+        return [
+            {
+                'project_id': self.project_ids[row],
+                'project_name': self.project_names[row],
+                'total': self.project_totals[row],
+                'severity-counts': self.SeverityCounts(row),
+            }
+            for row in rows
+        ]
+
+    def Rollup(self, top=10):
+        return {
+            'total': self.Total(),
+            'projects': len(self),
+            'severity-totals': self.SeverityTotals(),
+            'top-projects': self.TopProjects(top),
+            'project-totals': dict(
+                zip(self.project_ids, self.project_totals)
+            ),
+        }
+
+    def Trend(self, previous):
+        if isinstance(previous, IssueAggregation):
+            previous = previous.Rollup(top=0)
+
+        previous_severities = previous.get('severity-totals', {})
+        previous_projects = previous.get('project-totals', {})
+
+        return {
+            'total': self.Total() - previous.get('total', 0),
+            'severity-totals': {
+                severity: count - previous_severities.get(severity, 0)
+                for severity, count in self.SeverityTotals().items()
+            },
+            'projects': {
+                project_id: total - previous_projects.get(project_id, 0)
+                for project_id, total in zip(
+                    self.project_ids, self.project_totals
+                )
+            },
+        }
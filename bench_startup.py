@@ -0,0 +1,75 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# Modules that must stay out of the startup path, they are imported by the
+# sink or client that needs them
+HEAVY_MODULES = ('aiohttp', 'requests', 'slack_sdk', 'pyarrow', 'zstandard')
+
+# Cumulative import time budget for main.py (the JSON-only path), well above
+# the 50-70ms it takes on a developer laptop to leave room for slow hosts
+TARGET_MS = 100
+
+IMPORT_TIME_LINE = re.compile(
+    r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$'
+)
+
+
+def MeasureImport(module):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True,
+    )
+
+    cumulative_us = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        name = match.group(4)
+        imported.add(name.split('.')[0])
+        if name == module:
+            cumulative_us = int(match.group(2))
+    return cumulative_us / 1000, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the import time of main.py with -X importtime"
+    )
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--target-ms', type=float, default=TARGET_MS)
+    parser.add_argument('--module', default='main')
+    arguments = parser.parse_args()
+
+    timings = []
+    heavy = set()
+    for _ in range(arguments.runs):
+        milliseconds, imported = MeasureImport(arguments.module)
+        timings.append(milliseconds)
+        heavy |= imported.intersection(HEAVY_MODULES)
+
+    median = statistics.median(timings)
+    print(
+        f"import {arguments.module}: median {median:.1f}ms,"
+        f" min {min(timings):.1f}ms, max {max(timings):.1f}ms"
+        f" over {arguments.runs} runs (target {arguments.target_ms:.0f}ms)"
+    )
+
+    failed = False
+    if heavy:
+        print(f"Heavy modules imported at startup: {', '.join(sorted(heavy))}")
+        failed = True
+    if median > arguments.target_ms:
+        print("Import time is over the target")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ResponseCache:
+    def __init__(self, directory, ttl=3600, max_bytes=512 * 1024 * 1024):
+        self._directory = directory
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # Get and Put run in worker threads, this guards the size estimate
+        # and eviction
+        self._lock = threading.Lock()
+        self._size = self._evict()
+
+    def _path(self, url, extension):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self._directory, f'{key}.json.{extension}')
+
+    def _compress(self, data):
+        if zstandard is not None:
+            return 'zst', zstandard.ZstdCompressor().compress(data)
+        return 'gz', gzip.compress(data)
+
+    def _decompress(self, extension, data):
+        if extension == 'zst':
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def Get(self, url):
+        extensions = ['gz'] if zstandard is None else ['zst', 'gz']
+        for extension in extensions:
+            path = self._path(url, extension)
+            try:
+                with open(path, 'rb') as f:
+                    entry = json.loads(self._decompress(extension, f.read()))
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError):
+                # Corrupt or truncated entry, treat it as a miss
+                continue
+            if entry['url'] != url:
+                continue
+
+            # The mtime doubles as the last-used time for LRU eviction
+            os.utime(path)
+            entry['fresh'] = time.time() - entry['stored'] < self._ttl
+            return entry
+        return None
+
+    def Put(self, url, body, etag=None):
+        entry = {
+            'url': url,
+            'etag': etag,
+            'stored': time.time(),
+            'body': body,
+        }
+        extension, data = self._compress(json.dumps(entry).encode('utf-8'))
+        path = self._path(url, extension)
+        temporary_path = (
+            f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        )
+        try:
+            with open(temporary_path, 'wb') as f:
+                f.write(data)
+            os.replace(temporary_path, path)
+        except OSError:
+            # Eg a full disk, don't leave the partial entry behind
+            try:
+                os.remove(temporary_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        # Only rescan the directory once the running size estimate (which
+        # overcounts replaced entries) goes over the limit
+        with self._lock:
+            self._size += len(data)
+            if self._size > self._max_bytes:
+                self._size = self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self._directory) as it:
+            for dir_entry in it:
+                if not dir_entry.name.endswith(('.gz', '.zst')):
+                    continue
+                stat = dir_entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
@@ -0,0 +1,169 @@
+import csv
+import json
+import sys
+
+# Imported by _ImportPyarrow on first use, it is slow to import
+pyarrow = None
+
+PROJECT_COLUMNS = (
+    'project_id', 'project_name', 'branch_id', 'project-direct-link',
+)
+ISSUE_COLUMNS = (
+    'id', 'severity', 'issue-kind', 'issue-type', 'issue-type-name', 'path',
+    'type', 'finding-id', 'issue-key', 'sub-tool', 'revision-id',
+    'latest-observed-on-run', 'direct-link',
+)
+COLUMNS = PROJECT_COLUMNS + ISSUE_COLUMNS
+
+
+def IssueRows(normalized_projects):
+    for project in normalized_projects:
+        project_values = (
+            project['project_id'],
+            project['project_name'],
+            project['branch_id'],
+            project['direct-link'],
+        )
+        for issue in project['issues']:
+            yield project_values + tuple(
+                issue.get(column) for column in ISSUE_COLUMNS
+            )
+
+
+def _FlatValue(value):
+    # Columnar formats get nested values (eg structured paths) as JSON text
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _ImportPyarrow(format):
+    global pyarrow
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError(f"pyarrow is required for {format} export")
+
+
+class NdjsonExporter:
+    binary = False
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.rows = 0
+
+    def Write(self, normalized_projects):
+        for row in IssueRows(normalized_projects):
+            self._stream.write(json.dumps(dict(zip(COLUMNS, row))))
+            self._stream.write('\n')
+            self.rows += 1
+
+    def close(self):
+        self._stream.flush()
+
+
+class CsvExporter:
+    binary = False
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._writer = csv.writer(stream)
+        self._writer.writerow(COLUMNS)
+        self.rows = 0
+
+    def Write(self, normalized_projects):
+        for row in IssueRows(normalized_projects):
+            self._writer.writerow([_FlatValue(value) for value in row])
+            self.rows += 1
+
+    def close(self):
+        self._stream.flush()
+
+
+class _ArrowBatchExporter:
+    binary = True
+
+    def __init__(self, stream, batch_size=10000):
+        _ImportPyarrow(self.format)
+        self._schema = pyarrow.schema(
+            [(column, pyarrow.string()) for column in COLUMNS]
+        )
+        self._writer = self._newWriter(stream, self._schema)
+        self._batch_size = batch_size
+        self._batch = []
+        self.rows = 0
+
+    def _flushBatch(self):
+        if not self._batch:
+            return
+        columns = [
+            pyarrow.array(values, type=pyarrow.string())
+            for values in zip(*self._batch)
+        ]
+        self._writer.write_batch(
+            pyarrow.record_batch(columns, schema=self._schema)
+        )
+        self._batch = []
+
+    def Write(self, normalized_projects):
+        for row in IssueRows(normalized_projects):
+            self._batch.append([_FlatValue(value) for value in row])
+            self.rows += 1
+            if len(self._batch) >= self._batch_size:
+                self._flushBatch()
+
+    def close(self):
+        self._flushBatch()
+        self._writer.close()
+
+
+class ParquetExporter(_ArrowBatchExporter):
+    format = 'parquet'
+
+    def _newWriter(self, stream, schema):
+        return pyarrow.parquet.ParquetWriter(stream, schema)
+
+
+class ArrowExporter(_ArrowBatchExporter):
+    format = 'arrow'
+
+    def _newWriter(self, stream, schema):
+        return pyarrow.ipc.new_stream(stream, schema)
+
+
+EXPORTERS = {
+    'ndjson': NdjsonExporter,
+    'csv': CsvExporter,
+    'parquet': ParquetExporter,
+    'arrow': ArrowExporter,
+}
+
+
+def ExportIssues(normalized_projects, format, path=None):
+    if format not in EXPORTERS:
+        raise ValueError(
+            f"Unknown export format '{format}', expected one of"
+            f" {', '.join(EXPORTERS)}"
+        )
+    exporter_class = EXPORTERS[format]
+
+    if path:
+        if exporter_class.binary:
+            stream = open(path, 'wb')
+        else:
+            stream = open(path, 'w', newline='', encoding='utf-8')
+    else:
+        stream = sys.stdout.buffer if exporter_class.binary else sys.stdout
+
+    try:
+        exporter = exporter_class(stream)
+        try:
+            exporter.Write(normalized_projects)
+        finally:
+            exporter.close()
+    finally:
+        if path:
+            stream.close()
+    return exporter.rows
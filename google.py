@@ -1,5 +1,14 @@
 import requests
 import json
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+from aggregation import IssueAggregation
+from history import TrendArrow
+from polaris import DescribeFailedProjects
+
+# Google Chat rejects messages whose JSON payload exceeds 32,000 bytes
+MAX_PAYLOAD_BYTES = 32000
 
 
 def GroupIssuesByPriority(issues):
@@ -18,7 +27,7 @@ def GroupIssuesByPriority(issues):
 
 def WidgetForIssue(issue_info):
 
-    untriaged_issues_count = len(issue_info['untriaged-issues'])
+    untriaged_issues_count = issue_info['untriaged-issues']
     untriaged_info = (
         f"({untriaged_issues_count} not triaged)"
         if untriaged_issues_count > 0
@@ -27,8 +36,8 @@ def WidgetForIssue(issue_info):
     return {
         "decoratedText": {
             "text": (
-                f"{len(issue_info['issues'])} {issue_info['severity']}"
-                f" issues {untriaged_info}"
+                f"{issue_info['issues']}{TrendArrow(issue_info['trend'])}"
+                f" {issue_info['severity']} issues {untriaged_info}"
             )
         }
     }
@@ -60,31 +69,44 @@ def SeverityToColor(severity):
 
 class Google:
 
-    def __init__(self, webhook_url):
+    def __init__(
+            self, webhook_url, max_payload_bytes=MAX_PAYLOAD_BYTES,
+            max_workers=4):
         self.webhook_url = webhook_url
+        self._max_payload_bytes = max_payload_bytes
+        self._max_workers = max_workers
+        self._client = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_workers
+        )
+        self._client.mount('https://', adapter)
+        self._client.mount('http://', adapter)
 
-    def _SummaryForProject(self, project):
+    def __del__(self):
+        self.close()
 
-        issues_per_priority = GroupIssuesByPriority(project['issues'])
-        untriaged_issues_per_priority = GroupIssuesByPriority(
-            project['untriaged-issues']
-        )
+    def close(self):
+        self._client.close()
+
+    def _SummaryForProject(
+            self, project, issues_per_priority,
+            untriaged_issues_per_priority, project_trend=None):
 
         issues_by_severity = [
             {
                 'severity': severity,
                 'issues': issues,
                 'untriaged-issues': untriaged_issues_per_priority.get(
-                    severity, []
+                    severity, 0
                 ),
+                'trend': (project_trend or {}).get(severity),
             }
             for (severity, issues) in issues_per_priority.items()
-            if len(issues) > 0
         ]
 
         max_issue_level = issues_by_severity[0]['severity']
         untriaged_issues = sum(
-            len(info['untriaged-issues']) for info in issues_by_severity
+            info['untriaged-issues'] for info in issues_by_severity
         )
 
         link_to_issues = {
@@ -126,48 +148,109 @@ class Google:
 
     def SendSummaryMessage(
             self, normalized_projects, normalized_projects_only_untriaged,
-            filter):
-        total_issues = 0
-        total_untriaged_issues = 0
-        for project in normalized_projects:
-            total_issues += len(project['issues'])
+            filter, aggregation=None, untriaged_aggregation=None,
+            trend=None, failed_projects=None):
+        if aggregation is None:
+            aggregation = IssueAggregation(normalized_projects)
+        if untriaged_aggregation is None:
+            untriaged_aggregation = IssueAggregation(
+                normalized_projects_only_untriaged
+            )
 
-            same_projects = [
-                other_project
-                for other_project in normalized_projects_only_untriaged
-                if other_project['project_id'] == project['project_id']
-            ]
-            project['untriaged-issues'] = (
-                same_projects[0]['issues'] if same_projects else []
+        total_issues = aggregation.Total()
+        total_untriaged_issues = 0
+        sections = []
+        for row, project in enumerate(normalized_projects):
+            untriaged_row = untriaged_aggregation.IndexOf(
+                project['project_id']
             )
-            total_untriaged_issues += len(project['untriaged-issues'])
+            if untriaged_row is None:
+                untriaged_issues_per_priority = {}
+            else:
+                untriaged_issues_per_priority = (
+                    untriaged_aggregation.SeverityCounts(untriaged_row)
+                )
+                total_untriaged_issues += (
+                    untriaged_aggregation.project_totals[untriaged_row]
+                )
+            sections.append(self._SummaryForProject(
+                project, aggregation.SeverityCounts(row),
+                untriaged_issues_per_priority,
+                (trend or {}).get(project['project_id']),
+            ))
 
-        summary = {
+        if failed_projects:
+            sections.append({
+                "header": "Incomplete report",
+                "widgets": [{
+                    "textParagraph": {
+                        "text": DescribeFailedProjects(failed_projects)
+                    }
+                }],
+            })
+
+        subtitle = (
+            f"There are {total_issues} issues in"
+            f" {len(normalized_projects)} projects."
+            f" {total_untriaged_issues} issues need to be triaged"
+        )
+        messages = self._SplitMessages(subtitle, sections)
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            list(executor.map(self._Post, messages))
+
+    def _Message(self, title, subtitle, sections):
+        return {
             "cardsV2": [
                 {
                     "cardId": "unique-card-id",
                     "card": {
                         "header": {
-                            "title": "Summary of polaris tickets",
-                            "subtitle": (
-                                f"There are {total_issues} issues in"
-                                f" {len(normalized_projects)} projects."
-                                f" {total_untriaged_issues} issues need"
-                                " to be triaged"
-                            ),
+                            "title": title,
+                            "subtitle": subtitle,
                         },
-                        "sections": list(map(
-                            self._SummaryForProject, normalized_projects
-                        )),
+                        "sections": sections,
                     }
                 }
             ],
         }
 
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        client = requests.Session()
-        client.post(
-            self.webhook_url, headers=headers, data=json.dumps(summary)
+    def _SplitMessages(self, subtitle, sections):
+        title = "Summary of polaris tickets"
+        # Leave room for the "(n/m)" suffix added to split message titles
+        budget = (
+            self._max_payload_bytes
+            - len(json.dumps(self._Message(title + " (00/00)", subtitle, [])))
         )
+
+        chunks = [[]]
+        chunk_size = 0
+        for section in sections:
+            # +2 for the ", " separating sections in the serialized list
+            section_size = len(json.dumps(section)) + 2
+            if chunks[-1] and chunk_size + section_size > budget:
+                chunks.append([])
+                chunk_size = 0
+            chunks[-1].append(section)
+            chunk_size += section_size
+
+        if len(chunks) == 1:
+            return [self._Message(title, subtitle, chunks[0])]
+        return [
+            self._Message(
+                f"{title} ({part}/{len(chunks)})", subtitle, chunk
+            )
+            for part, chunk in enumerate(chunks, start=1)
+        ]
+
+    def _Post(self, message):
+        response = self._client.post(
+            self.webhook_url,
+            headers={'Content-Type': 'application/json'},
+            data=json.dumps(message),
+        )
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"Failed: Unexpected response from Google Spaces"
+                f" (HTTP {response.status_code}): {response.text}"
+            )
@@ -0,0 +1,149 @@
+import sqlite3
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    filter TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_filter_started_at ON runs (filter, started_at);
+
+CREATE TABLE IF NOT EXISTS severity_counts (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    project_id TEXT NOT NULL,
+    project_name TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (run_id, project_id, severity)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS severity_counts_project
+    ON severity_counts (project_id, run_id);
+'''
+
+
+def FilterKey(filter):
+    return ','.join(
+        f"{name}={'true' if filter.get(name) else 'false'}"
+        for name in ('only-security', 'only-untriaged')
+    )
+
+
+def TrendArrow(delta):
+    if not delta:
+        return ''
+    if delta > 0:
+        return f' ↑{delta}'
+    return f' ↓{-delta}'
+
+
+# Append-only store of per-run, per-project severity counts. Runs are kept
+# apart per filter so untriaged crawls are only compared with each other.
+class TrendStore:
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def RecordRun(self, aggregation, filter, started_at=None):
+        if started_at is None:
+            started_at = time.time()
+
+        with self._connection:
+            cursor = self._connection.execute(
+                'INSERT INTO runs (started_at, filter) VALUES (?, ?)',
+                (started_at, FilterKey(filter)),
+            )
+            run_id = cursor.lastrowid
+            self._connection.executemany(
+                'INSERT INTO severity_counts'
+                ' (run_id, project_id, project_name, severity, count)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                (
+                    (run_id, project_id, project_name, severity, count)
+                    for row, (project_id, project_name) in enumerate(zip(
+                        aggregation.project_ids, aggregation.project_names
+                    ))
+                    for severity, count in (
+                        aggregation.SeverityCounts(row).items()
+                    )
+                ),
+            )
+        return run_id
+
+    def LastRun(self, filter):
+        return self._connection.execute(
+            'SELECT id, started_at FROM runs WHERE filter = ?'
+            ' ORDER BY started_at DESC LIMIT 1',
+            (FilterKey(filter),),
+        ).fetchone()
+
+    def FirstRunSince(self, filter, since):
+        return self._connection.execute(
+            'SELECT id, started_at FROM runs'
+            ' WHERE filter = ? AND started_at >= ?'
+            ' ORDER BY started_at ASC LIMIT 1',
+            (FilterKey(filter), since),
+        ).fetchone()
+
+    def CountsForRun(self, run_id):
+        counts = {}
+        for project_id, severity, count in self._connection.execute(
+            'SELECT project_id, severity, count FROM severity_counts'
+            ' WHERE run_id = ?',
+            (run_id,),
+        ):
+            counts.setdefault(project_id, {})[severity] = count
+        return counts
+
+    def ProjectHistory(self, project_id, filter, since=0):
+        history = {}
+        for started_at, severity, count in self._connection.execute(
+            'SELECT runs.started_at, severity_counts.severity,'
+            ' severity_counts.count'
+            ' FROM severity_counts JOIN runs'
+            ' ON runs.id = severity_counts.run_id'
+            ' WHERE severity_counts.project_id = ?'
+            ' AND runs.filter = ? AND runs.started_at >= ?'
+            ' ORDER BY runs.started_at',
+            (project_id, FilterKey(filter), since),
+        ):
+            history.setdefault(started_at, {})[severity] = count
+        return list(history.items())
+
+    def Delta(self, aggregation, run_id):
+        previous = self.CountsForRun(run_id)
+
+        deltas = {}
+        for row, project_id in enumerate(aggregation.project_ids):
+            counts = aggregation.SeverityCounts(row)
+            previous_counts = previous.pop(project_id, {})
+            deltas[project_id] = {
+                severity: (
+                    counts.get(severity, 0)
+                    - previous_counts.get(severity, 0)
+                )
+                for severity in set(counts) | set(previous_counts)
+            }
+
+        # Projects without any issues left are not in the aggregation
+        for project_id, previous_counts in previous.items():
+            deltas[project_id] = {
+                severity: -count
+                for severity, count in previous_counts.items()
+            }
+        return deltas
+
+    def DeltaSinceLastRun(self, aggregation, filter):
+        run = self.LastRun(filter)
+        if run is None:
+            return None
+        return self.Delta(aggregation, run[0])
+
+    def DeltaSince(self, aggregation, filter, seconds):
+        run = self.FirstRunSince(filter, time.time() - seconds)
+        if run is None:
+            return None
+        return self.Delta(aggregation, run[0])
@@ -1,12 +1,17 @@
+import argparse
 import json
 import logging
 import sys
 import datetime
+import os
 from os import environ
 
-from polaris import Polaris
-from slack import Slack
-from google import Google
+# Sinks, the response cache and the HTTP clients are imported where they are
+# first used, so a run only pays for the modules it needs. Keep it that way,
+# bench_startup.py checks the import time of this module.
+
+from polaris import Polaris, FailedProjectDescriptions
+from aggregation import IssueAggregation
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,27 +20,133 @@ logging.basicConfig(
 
 logger = logging.getLogger('polaris-slack')
 
+EXIT_FATAL = 1
+# Reports were sent, but some projects timed out or failed
+EXIT_INCOMPLETE = 3
+
+
+def OptionalFloat(value):
+    return float(value) if value else None
+
+
+def ShouldRecordRun(polaris, filter, replay):
+    # Replayed runs were recorded when they were fetched, and incomplete
+    # runs would show up as a drop in the trend
+    return not replay and not polaris.GetFailedProjects(filter)
+
+
+def LogRollup(aggregation, rollup_file=None, record=True):
+    rollup = aggregation.Rollup()
+    logger.info(
+        f"Severity totals {rollup['severity-totals']}, top projects "
+        + ", ".join(
+            f"{x['project_name']} ({x['total']})"
+            for x in rollup['top-projects']
+        )
+    )
+    if not rollup_file:
+        return
+
+    try:
+        with open(rollup_file) as f:
+            trend = aggregation.Trend(json.load(f))
+        logger.info(
+            f"Trend since previous run: {trend['total']:+d} issues,"
+            f" {trend['severity-totals']}"
+        )
+    except FileNotFoundError:
+        logger.info(f"No previous rollup in {rollup_file}")
+    except (OSError, ValueError, AttributeError, TypeError) as e:
+        logger.warning(
+            f"Ignoring unreadable previous rollup in {rollup_file} ({e})"
+        )
+
+    if not record:
+        logger.info(
+            f"Not updating {rollup_file} for a replayed or incomplete run"
+        )
+        return
+    # Written through a temporary file so an interrupted run never leaves
+    # a truncated rollup behind
+    temporary_path = f'{rollup_file}.{os.getpid()}.tmp'
+    try:
+        with open(temporary_path, 'w') as f:
+            json.dump(rollup, f)
+        os.replace(temporary_path, rollup_file)
+    except OSError as e:
+        logger.warning(f"Failed to write the rollup to {rollup_file} ({e})")
+        try:
+            os.remove(temporary_path)
+        except FileNotFoundError:
+            pass
+
+
+def RecordTrend(history, aggregation, filter, polaris, replay):
+    if history is None:
+        return None
+    trend = history.DeltaSinceLastRun(aggregation, filter)
+    if ShouldRecordRun(polaris, filter, replay):
+        history.RecordRun(aggregation, filter)
+    return trend
+
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(
+        description="Report Polaris issues to Slack or Google Spaces"
+    )
+    parser.add_argument(
+        '--replay', action='store_true',
+        help="rebuild the reports from POLARIS_CACHE_DIR without calling"
+             " the Polaris API",
+    )
+    return parser.parse_args()
+
 
 def main():
+    arguments = ParseArguments()
+    polaris = None
+    history = None
+    google = None
     try:
         polaris_url = environ.get('POLARIS_URL')
         token = environ.get('POLARIS_TOKEN')
         send_both_issues_and_untriaged_at_once_to_slack = environ.get(
             'SEND_BOTH_ISSUES_AND_UNTRIAGED_AT_ONCE_TO_SLACK'
         )
+        rollup_file = environ.get('POLARIS_ROLLUP_FILE')
+        export_format = environ.get('POLARIS_EXPORT_FORMAT')
+        export_file = environ.get('POLARIS_EXPORT_FILE')
         retries = int(environ.get('POLARIS_RETRIES', 1))
         wait_seconds = int(environ.get('POLARIS_WAIT_SECONDS', 60))
+        cache_dir = environ.get('POLARIS_CACHE_DIR')
+        cache_ttl = int(environ.get('POLARIS_CACHE_TTL', 3600))
+        cache_max_mb = int(environ.get('POLARIS_CACHE_MAX_MB', 512))
+        history_db = environ.get('POLARIS_HISTORY_DB')
+        request_timeout = OptionalFloat(
+            environ.get('POLARIS_REQUEST_TIMEOUT')
+        )
+        project_timeout = OptionalFloat(
+            environ.get('POLARIS_PROJECT_TIMEOUT')
+        )
+        run_timeout = OptionalFloat(environ.get('POLARIS_RUN_TIMEOUT'))
 
         if not polaris_url:
             logger.critical("Environment variable POLARIS_URL is unset")
-        if not token:
+        if not token and not arguments.replay:
             logger.critical("Environment variable POLARIS_TOKEN is unset")
-        if not polaris_url or not token:
-            exit(1)
+        if not cache_dir and arguments.replay:
+            logger.critical(
+                "Environment variable POLARIS_CACHE_DIR is unset, it is"
+                " required with --replay"
+            )
+        if (not polaris_url or (not token and not arguments.replay)
+                or (not cache_dir and arguments.replay)):
+            exit(EXIT_FATAL)
 
         slack_webhook_url = environ.get('SLACK_WEBHOOK_URL')
         google_spaces_url = environ.get('GOOGLE_SPACES_URL')
-        if (not slack_webhook_url) and (not google_spaces_url):
+        if ((not slack_webhook_url) and (not google_spaces_url)
+                and (not export_format)):
             logger.warning(
                 "Environment SLACK_WEBHOOK and GOOGLE_SPACES_URL is"
                 " unset, just outputting issues to console."
@@ -43,8 +154,17 @@ def main():
         logger.info(
             f"Polaris starting at {datetime.datetime.now().isoformat()}"
         )
+        cache = None
+        if cache_dir:
+            from cache import ResponseCache
+            cache = ResponseCache(
+                cache_dir, ttl=cache_ttl, max_bytes=cache_max_mb * 1024 * 1024
+            )
         polaris = Polaris(
-            polaris_url, token, retries=retries, wait_seconds=wait_seconds
+            polaris_url, token, retries=retries, wait_seconds=wait_seconds,
+            cache=cache, replay=arguments.replay,
+            request_timeout=request_timeout, project_timeout=project_timeout,
+            run_timeout=run_timeout,
         )
 
         filter = {
@@ -59,10 +179,36 @@ def main():
             f" at {datetime.datetime.now().isoformat()}"
         )
         projects_with_issues = polaris.GetProjectsAndIssues(filter)
+        aggregation = IssueAggregation(projects_with_issues)
+        LogRollup(
+            aggregation, rollup_file,
+            ShouldRecordRun(polaris, filter, arguments.replay)
+        )
+
+        if history_db:
+            from history import TrendStore
+            history = TrendStore(history_db)
+        trend = RecordTrend(
+            history, aggregation, filter, polaris, arguments.replay
+        )
+
+        if export_format:
+            from export import ExportIssues
+            rows = ExportIssues(
+                projects_with_issues, export_format.lower(), export_file
+            )
+            logger.info(
+                f"Exported {rows} issues as {export_format}"
+                f" to {export_file or 'stdout'}"
+            )
 
         if slack_webhook_url:
+            from slack import Slack
             slack = Slack(slack_webhook_url)
-            slack.SendSummaryPerProjects(projects_with_issues, filter)
+            slack.SendSummaryPerProjects(
+                projects_with_issues, filter, aggregation, trend,
+                polaris.GetFailedProjects(filter)
+            )
             if (str(send_both_issues_and_untriaged_at_once_to_slack).lower()
                     == "true"):
                 logger.info(
@@ -72,25 +218,72 @@ def main():
                 projects_with_untriaged_issues = (
                     polaris.GetProjectsAndIssues(filter_untriaged)
                 )
+                untriaged_aggregation = IssueAggregation(
+                    projects_with_untriaged_issues
+                )
+                untriaged_trend = RecordTrend(
+                    history, untriaged_aggregation, filter_untriaged,
+                    polaris, arguments.replay
+                )
                 slack.SendSummaryPerProjects(
-                    projects_with_untriaged_issues, filter_untriaged
+                    projects_with_untriaged_issues, filter_untriaged,
+                    untriaged_aggregation, untriaged_trend,
+                    polaris.GetFailedProjects(filter_untriaged)
                 )
         elif google_spaces_url:
             projects_with_untriaged_issues = polaris.GetProjectsAndIssues(
                 filter_untriaged
             )
+            untriaged_aggregation = IssueAggregation(
+                projects_with_untriaged_issues
+            )
+            RecordTrend(
+                history, untriaged_aggregation, filter_untriaged, polaris,
+                arguments.replay
+            )
+            from google import Google
             google = Google(google_spaces_url)
             google.SendSummaryMessage(
-                projects_with_issues, projects_with_untriaged_issues, filter
+                projects_with_issues, projects_with_untriaged_issues, filter,
+                aggregation, untriaged_aggregation, trend,
+                polaris.GetFailedProjects()
             )
-        else:
-            print(json.dumps(projects_with_issues, indent=2))
+        elif not export_format:
+            json.dump(projects_with_issues, sys.stdout, indent=2)
+            print()
+
+        stats = polaris.GetRequestStats()
+        logger.info(
+            f"Polaris requests: {stats['requests']},"
+            f" memoized: {stats['memoized']},"
+            f" coalesced: {stats['coalesced']},"
+            f" hit rate: {stats['hit-rate']:.1%}"
+        )
+        failed_projects = polaris.GetFailedProjects()
     except Exception as e:
-        print(f"Fatal error: {e}", flush=True)
+        print(f"Fatal error: {e}", file=sys.stderr, flush=True)
         logger.critical(f"Fatal error: {e}", exc_info=True)
-        sys.exit(1)
+        sys.exit(EXIT_FATAL)
+    finally:
+        # Release connections and the history database explicitly rather
+        # than relying on garbage collection, main() may run many times in
+        # one process (see soak.py)
+        if polaris is not None:
+            polaris.close()
+        if google is not None:
+            google.close()
+        if history is not None:
+            history.close()
     logger.info(f"Finished at {datetime.datetime.now().isoformat()}")
 
+    if failed_projects:
+        descriptions = FailedProjectDescriptions(failed_projects)
+        logger.warning(
+            f"{len(descriptions)} projects timed out or failed: "
+            + ", ".join(descriptions)
+        )
+        sys.exit(EXIT_INCOMPLETE)
+
 
 if __name__ == '__main__':
     main()
@@ -1,10 +1,10 @@
-import requests
-import urllib
+import urllib.parse
+import email.utils
+import logging
 import math
-import aiohttp
 import asyncio
 import time
-import sys
+from operator import itemgetter
 
 ISSUE_SEVERITY_RANKS = {
     "Critical": 0,
@@ -14,17 +14,126 @@ ISSUE_SEVERITY_RANKS = {
     "Audit": 4
 }
 
+logger = logging.getLogger('polaris-slack')
 
-class Polaris:
-    def __init__(self, url, token, retries, wait_seconds):
+
+def IndexByTypeAndId(items):
+    index = {}
+    for item in items:
+        index.setdefault((item['type'], item['id']), []).append(item)
+    return index
+
+
+def FailedProjectDescriptions(failed_projects):
+    # The issues and untriaged crawls can fail on the same project, label
+    # the untriaged one and drop exact repeats (eg when both crawls use the
+    # same filter)
+    descriptions = {}
+    for x in failed_projects:
+        crawl = (
+            ", untriaged" if (x['filter'] or {}).get('only-untriaged')
+            else ""
+        )
+        descriptions[f"{x['project_name']} ({x['reason']}{crawl})"] = None
+    return list(descriptions)
+
+
+def DescribeFailedProjects(failed_projects, limit=20):
+    descriptions = FailedProjectDescriptions(failed_projects)
+    count = len(descriptions)
+    if count > limit:
+        descriptions = descriptions[:limit]
+        descriptions.append(f"and {count - limit} more")
+    return (
+        f"Incomplete report, {count} projects timed out or"
+        f" failed: {', '.join(descriptions)}"
+    )
+
+
+class AsyncPolaris:
+    def __init__(
+            self, url, token, retries, wait_seconds, cache=None,
+            replay=False, memoize=True, session=None, request_timeout=None,
+            project_timeout=None, run_timeout=None):
         self._baseurl = url
-        self._client = requests.Session()
+        self._token = token
+        self._session = session
+        self._owns_session = session is None
         self._retries = retries
         self._wait_seconds = wait_seconds
-        self._jwt = self.getJwt(token)
-
-    def __del__(self):
-        self._client.close()
+        self._cache = cache
+        self._replay = replay
+        self._memoize = memoize
+        self._memo = {}
+        self._run_number = 0
+        self._inflight = {}
+        self._waiters = {}
+        self._request_stats = {'requests': 0, 'memoized': 0, 'coalesced': 0}
+        self._jwt = None
+        self._request_timeout = request_timeout
+        self._client_timeout = None
+        self._project_timeout = project_timeout
+        self._run_timeout = run_timeout
+        self._deadline = None
+        self._failed_projects = []
+        if replay and cache is None:
+            raise ValueError("Replay mode needs a response cache")
+
+    async def __aenter__(self):
+        # __aexit__ doesn't run when open() fails, eg on authentication
+        try:
+            await self.open()
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def open(self):
+        self.StartRun()
+        # aiohttp is imported on first use, replayed runs never need it
+        if not self._replay:
+            import aiohttp
+            if self._session is None:
+                self._session = aiohttp.ClientSession()
+            if self._request_timeout is not None:
+                self._client_timeout = aiohttp.ClientTimeout(
+                    total=self._request_timeout
+                )
+        # Replayed runs are served from the cache and never authenticate
+        if not self._replay and self._jwt is None:
+            try:
+                self._jwt = await asyncio.wait_for(
+                    self.getJwt(self._token), self._timeLeft()
+                )
+            except asyncio.TimeoutError:
+                # Reported by every crawl of this run, see
+                # GetProjectsAndIssues
+                logger.warning("Authentication with Polaris timed out")
+
+    def StartRun(self):
+        # The run timeout, the memo and the failed projects cover one run,
+        # which starts in open() or here for long-lived clients
+        self._deadline = (
+            None if self._run_timeout is None
+            else time.monotonic() + self._run_timeout
+        )
+        self._failed_projects = []
+        self._run_number += 1
+        self.ClearMemo()
+
+    async def close(self):
+        pending = list(self._inflight.values())
+        for future in pending:
+            future.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._inflight.clear()
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
 
     def _getHeaders(self):
         headers = {
@@ -34,66 +143,126 @@ class Polaris:
         }
         return headers
 
+    # Compression and file I/O run in the default executor, off the event
+    # loop. A broken cache only costs the cache, never the fetch.
+    async def _getCacheEntry(self, url):
+        if self._cache is None:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            entry = await loop.run_in_executor(None, self._cache.Get, url)
+        except Exception as e:
+            logger.warning(f"Failed to read {url} from the cache ({e})")
+            entry = None
+        if self._replay and entry is None:
+            raise RuntimeError(f"Failed: {url} is not in the cache")
+        return entry
+
+    async def _putCacheEntry(self, url, body, etag):
+        if self._cache is None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._cache.Put, url, body, etag)
+        except Exception as e:
+            logger.warning(f"Failed to write {url} to the cache ({e})")
+
+    def GetRequestStats(self):
+        stats = dict(self._request_stats)
+        hits = stats['memoized'] + stats['coalesced']
+        stats['hit-rate'] = (
+            hits / stats['requests'] if stats['requests'] else 0.0
+        )
+        return stats
+
+    def ClearMemo(self):
+        self._memo.clear()
+
+    def GetFailedProjects(self, filter=None):
+        return [
+            x for x in self._failed_projects
+            if filter is None or x['filter'] == filter
+        ]
+
+    def _timeLeft(self, timeout=None):
+        if self._deadline is None:
+            return timeout
+        left = max(self._deadline - time.monotonic(), 0)
+        return left if timeout is None else min(timeout, left)
+
+    def _projectFailed(self, project_id, project_name, filter, reason):
+        logger.warning(f"Skipping {project_name} ({reason})")
+        self._failed_projects.append({
+            'project_id': project_id,
+            'project_name': project_name,
+            'filter': filter,
+            'reason': reason,
+        })
+
     def getFullUrl(self, path):
         return urllib.parse.urljoin(self._baseurl, path)
 
-    def getJwt(self, token):
+    async def getJwt(self, token):
         auth_headers = {'Content-Type': 'application/x-www-form-urlencoded'}
         auth_params = {'accesstoken': token}
+        status = 'N/A'
+        kwargs = {}
+        if self._client_timeout is not None:
+            kwargs['timeout'] = self._client_timeout
 
         for attempt in range(self._retries):
             try:
-                response = self._client.post(
+                async with self._session.post(
                     self.getFullUrl('/api/auth/authenticate'),
                     headers=auth_headers,
-                    data=auth_params
-                )
-                if response.status_code == 200:
-                    json_payload = response.json()
-                    return json_payload['jwt']
-                else:
-                    raise Exception(f"HTTP {response.status_code}")
+                    data=auth_params,
+                    **kwargs
+                ) as response:
+                    status = response.status
+                    if response.status == 200:
+                        json_payload = await response.json(content_type=None)
+                        return json_payload['jwt']
+                    else:
+                        raise Exception(f"HTTP {response.status}")
             except Exception as e:
                 if attempt < self._retries - 1:
-                    print(
-                        f"Warning: Failed to authenticate with Polaris"
+                    logger.warning(
+                        f"Failed to authenticate with Polaris"
                         f" ({e}). Retrying in {self._wait_seconds}"
-                        " seconds...",
-                        flush=True
+                        " seconds..."
                     )
-                    time.sleep(self._wait_seconds)
+                    await asyncio.sleep(self._wait_seconds)
                 else:
-                    print(
+                    logger.error(
                         f"Failed to authenticate after {self._retries}"
-                        f" attempts. Last error: {e}",
-                        flush=True
+                        f" attempts. Last error: {e}"
                     )
                     raise RuntimeError(
                         f"Failed: Unexpected response from Polaris after"
                         f" {self._retries} attempts"
-                        f" (HTTP {getattr(response, 'status_code', 'N/A')})"
+                        f" (HTTP {status})"
                     )
         return None
 
-    def GetApplication(self, application_id):
+    async def GetApplication(self, application_id):
         url = self.getFullUrl(
             f'/api/common/v0/applications/{application_id}'
         )
-        return self._request_with_retries(
+        return await self._request_with_retries(
             "GET", url, headers=self._getHeaders()
         )
 
-    def GetProjectsFromApplication(self, application_id):
+    async def GetProjectsFromApplication(self, application_id):
         url = (
             self.getFullUrl('/api/common/v0/projects')
             + f'?page[limit]=500&application-id={application_id}'
             '&include[project][]=branches&include[project][]=runs'
         )
-        return self._request_with_retries(
+        return await self._request_with_retries(
             "GET", url, headers=self._getHeaders()
         )
 
-    def GetProjectsByCustomProperty(self, **kwargs):
+    async def GetProjectsByCustomProperty(self, **kwargs):
         custom_properties = "&".join(
             "filter[project][properties][{}][$eq]={}".format(*i)
             for i in kwargs.items()
@@ -103,22 +272,22 @@ class Polaris:
             + f'?page[limit]=500&{custom_properties}'
             '&include[project][]=branches&include[project][]=runs'
         )
-        return self._request_with_retries(
+        return await self._request_with_retries(
             "GET", url, headers=self._getHeaders()
         )
 
-    def _getProjects(self):
+    async def _getProjects(self):
         url = (
             self.getFullUrl('/api/common/v0/projects')
             + '?page[limit]=500'
             '&include[project][]=branches&include[project][]=runs'
         )
-        return self._request_with_retries(
+        return await self._request_with_retries(
             "GET", url, headers=self._getHeaders()
         )
 
     async def _getPaginatedIssuePage(
-            self, session, project_id, branch_id, limit, offset, filter):
+            self, project_id, branch_id, limit, offset, filter):
         query_args = [
             f"page[limit]={limit}",
             f"page[offset]={offset}",
@@ -142,52 +311,13 @@ class Polaris:
         request_url = self.getFullUrl(
             '/api/query/v1/issues' + '?' + '&'.join(query_args)
         )
-        for attempt in range(self._retries):
-            async with session.get(
-                request_url, headers=self._getHeaders()
-            ) as response:
-                content_type = response.headers.get('Content-Type', '')
-                try:
-                    if ('application/vnd.api+json' not in content_type
-                            and 'application/json' not in content_type):
-                        if attempt < self._retries - 1:
-                            print(
-                                f"Warning: Unexpected Content-Type"
-                                f" '{content_type}' from Polaris."
-                                f" Retrying in {self._wait_seconds}"
-                                " seconds...",
-                                flush=True
-                            )
-                            await asyncio.sleep(self._wait_seconds)
-                            continue
-                        else:
-                            raise RuntimeError(
-                                f"Failed: Unexpected Content-Type"
-                                f" '{content_type}' from Polaris after"
-                                f" {self._retries} attempts"
-                                f" (HTTP {response.status})"
-                            )
-                    return await response.json()
-                except Exception:
-                    if attempt < self._retries - 1:
-                        print(
-                            f"Warning: Unexpected response from Polaris"
-                            f" (HTTP {response.status})."
-                            f" Retrying in {self._wait_seconds} seconds...",
-                            flush=True
-                        )
-                        await asyncio.sleep(self._wait_seconds)
-                    else:
-                        raise RuntimeError(
-                            f"Failed: Unexpected response from Polaris"
-                            f" after {self._retries} attempts"
-                            f" (HTTP {response.status})"
-                        )
+        return await self._request_with_retries(
+            "GET", request_url, headers=self._getHeaders()
+        )
 
-    async def _getPaginatedIssues(
-            self, session, project_id, branch_id, filter):
+    async def _getPaginatedIssues(self, project_id, branch_id, filter):
         first_page = await self._getPaginatedIssuePage(
-            session, project_id, branch_id, 500, 0, filter
+            project_id, branch_id, 500, 0, filter
         )
         yield first_page
 
@@ -195,17 +325,19 @@ class Polaris:
         limit = first_page['meta']['limit']
 
         if total > len(first_page['data']):
-            for page in range(1, math.ceil(total/limit)):
-                yield self._getPaginatedIssuePage(
-                    session, project_id, branch_id, limit, page*limit, filter
+            pages = await asyncio.gather(*[
+                self._getPaginatedIssuePage(
+                    project_id, branch_id, limit, page*limit, filter
                 )
+                for page in range(1, math.ceil(total/limit))
+            ])
+            for page in pages:
+                yield page
 
-    async def _getProjectIssues(self, session, project_id, branch_id, filter):
+    async def _getProjectIssues(self, project_id, branch_id, filter):
         data = []
         included = []
-        pages = self._getPaginatedIssues(
-            session, project_id, branch_id, filter
-        )
+        pages = self._getPaginatedIssues(project_id, branch_id, filter)
         try:
             async for page in pages:
                 page_data = page['data']
@@ -213,7 +345,7 @@ class Polaris:
                 data.extend(page_data)
                 included.extend(page_included)
         finally:
-            pages.aclose()
+            await pages.aclose()
 
         return {
             'data': data,
@@ -247,14 +379,12 @@ class Polaris:
         )
 
     async def _NormalizedProjectAndIssues(
-            self, session, runs, project_id, branch_id, project_name, filter):
-        issues = await self._getProjectIssues(
-            session, project_id, branch_id, filter
-        )
+            self, runs, project_id, branch_id, project_name, filter):
+        issues = await self._getProjectIssues(project_id, branch_id, filter)
 
         data = issues['data']
         if len(data) > 0:
-            print(project_name, flush=True)
+            logger.info(project_name)
             untriaged_filter = filter.copy()
             untriaged_filter['only-untriaged'] = True
             return {
@@ -267,35 +397,57 @@ class Polaris:
                 'direct-link-untriaged': self.FormatProjectUrl(
                     project_id, branch_id, untriaged_filter
                 ),
-                'issues': self.NormalizeIssues(
-                    data, issues['included'], runs, project_id, branch_id
+                'issues': self._normalizeIssues(
+                    data, IndexByTypeAndId(issues['included']), runs,
+                    project_id, branch_id
                 ),
             }
 
-    def GetProjectsAndIssues(self, filter=None):
-        if sys.version_info >= (3, 7):
-            return asyncio.run(self._GetProjectsAndIssues(filter))
-        loop = asyncio.new_event_loop()
+    async def _NormalizedProjectAndIssuesWithinBudget(
+            self, runs, project_id, branch_id, project_name, filter):
+        # A slow or failing project is reported and left out instead of
+        # holding up or failing the whole crawl
         try:
-            return loop.run_until_complete(self._GetProjectsAndIssues(filter))
-        finally:
-            loop.close()
+            return await asyncio.wait_for(
+                self._NormalizedProjectAndIssues(
+                    runs, project_id, branch_id, project_name, filter
+                ),
+                self._timeLeft(self._project_timeout),
+            )
+        except asyncio.TimeoutError:
+            reason = "timed out"
+        except Exception as e:
+            reason = f"failed: {e}"
+        self._projectFailed(project_id, project_name, filter, reason)
+        return None
+
+    async def GetProjectsAndIssues(self, filter=None):
+        if not self._replay and self._jwt is None:
+            self._projectFailed(None, "authentication", filter, "timed out")
+            return []
 
-    async def _GetProjectsAndIssues(self, filter):
-        projects = self._getProjects()
+        try:
+            projects = await asyncio.wait_for(
+                self._getProjects(), self._timeLeft()
+            )
+        except asyncio.TimeoutError:
+            self._projectFailed(
+                None, "project list", filter, "timed out"
+            )
+            return []
 
         project_include = []
         runs = []
+        project_names = {
+            x['id']: x['attributes']['name'] for x in projects['data']
+        }
 
         for include in projects['included']:
             if (include['type'] == 'branch'
                     and include['attributes']['main-for-project']):
                 branch_id = include['id']
                 project_id = include['relationships']['project']['data']['id']
-                project_name = [
-                    x for x in projects['data']
-                    if x['id'] == project_id
-                ][0]['attributes']['name']
+                project_name = project_names[project_id]
 
                 project_include.append({
                     'project_id': project_id,
@@ -305,19 +457,19 @@ class Polaris:
             elif include['type'] == 'run':
                 runs.append(include)
 
-        project_with_issues = []
+        # Every project looks up its issues' runs here, index them once
+        runs = IndexByTypeAndId(runs)
 
-        async with aiohttp.ClientSession() as session:
-            project_with_issues = await asyncio.gather(*[
-                self._NormalizedProjectAndIssues(
-                    session, runs,
-                    projectandinclude['project_id'],
-                    projectandinclude['branch_id'],
-                    projectandinclude['project_name'],
-                    filter,
-                )
-                for projectandinclude in project_include
-            ])
+        project_with_issues = await asyncio.gather(*[
+            self._NormalizedProjectAndIssuesWithinBudget(
+                runs,
+                projectandinclude['project_id'],
+                projectandinclude['branch_id'],
+                projectandinclude['project_name'],
+                filter,
+            )
+            for projectandinclude in project_include
+        ])
 
         # Filter out projects with no issues (None entries)
         project_with_issues = [x for x in project_with_issues if x is not None]
@@ -375,7 +527,16 @@ class Polaris:
         return normalized_data
 
     def NormalizeIssues(self, data, included, runs, project_id, branch_id):
-        issues = []
+        return self._normalizeIssues(
+            data, IndexByTypeAndId(included), IndexByTypeAndId(runs),
+            project_id, branch_id
+        )
+
+    def _normalizeIssues(
+            self, data, included, runs, project_id, branch_id):
+        # Bucket by severity rank while normalizing so only the (issue-type,
+        # path) tie-break needs sorting.
+        issues_per_rank = [[] for _ in ISSUE_SEVERITY_RANKS]
 
         for issue in data:
             normalized_data = {}
@@ -397,17 +558,11 @@ class Polaris:
                 relationship_id = relationship_value['data']['id']
 
                 if relationship_key == 'latest-observed-on-run':
-                    value = [
-                        x for x in runs
-                        if x['type'] == relationship_type
-                        and x['id'] == relationship_id
-                    ]
+                    value = runs.get((relationship_type, relationship_id), [])
                 else:
-                    value = [
-                        x for x in included
-                        if x['type'] == relationship_type
-                        and x['id'] == relationship_id
-                    ]
+                    value = included.get(
+                        (relationship_type, relationship_id), []
+                    )
 
                 if len(value) > 0:
                     normalized_data = self.NormalizeIssueRelationshipValues(
@@ -416,55 +571,272 @@ class Polaris:
                 # else:
                 #     print(f'{relationship_key} couldn\'t be found')
 
-            issues.append(self.NormalizeIssue(
+            normalized_issue = self.NormalizeIssue(
                 normalized_data, project_id, branch_id
-            ))
-
-        return sorted(
-            issues,
-            key=lambda x: (
-                int(ISSUE_SEVERITY_RANKS[x['severity']]),
-                x['issue-type'],
-                x['path'],
             )
+            rank = ISSUE_SEVERITY_RANKS[normalized_issue['severity']]
+            issues_per_rank[rank].append(normalized_issue)
+
+        issues = []
+        sort_key = itemgetter('issue-type', 'path')
+        for rank_issues in issues_per_rank:
+            rank_issues.sort(key=sort_key)
+            issues.extend(rank_issues)
+        return issues
+
+    async def _request_with_retries(self, method, url, **kwargs):
+        if method != 'GET':
+            return await self._fetch(method, url, **kwargs)
+        return await self._coalesce(
+            url, lambda: self._fetch(method, url, **kwargs)
         )
 
-    def _request_with_retries(self, method, url, **kwargs):
+    async def _coalesce(self, url, fetch):
+        # Identical requests in flight share one future, and successful
+        # results are memoized until the next run starts
+        self._request_stats['requests'] += 1
+        if url in self._memo:
+            self._request_stats['memoized'] += 1
+            return self._memo[url]
+
+        run_number = self._run_number
+
+        def done(future):
+            if self._inflight.get(url) is future:
+                del self._inflight[url]
+            # A fetch started in an earlier run must not refill the memo
+            if (self._memoize and run_number == self._run_number
+                    and not future.cancelled()
+                    and future.exception() is None):
+                self._memo[url] = future.result()
+
+        future = self._inflight.get(url)
+        if future is not None:
+            self._request_stats['coalesced'] += 1
+        else:
+            future = asyncio.ensure_future(fetch())
+            future.add_done_callback(done)
+            self._inflight[url] = future
+            self._waiters[future] = 0
+
+        self._waiters[future] += 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            # The shield keeps one cancelled waiter (eg a timed out project)
+            # from cancelling the others, so the fetch is only cancelled
+            # once nobody waits for it any more
+            self._waiters[future] -= 1
+            if not self._waiters[future]:
+                del self._waiters[future]
+                if not future.done():
+                    future.cancel()
+                    if self._inflight.get(url) is future:
+                        del self._inflight[url]
+
+    def _retryDelay(self, response):
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None:
+            try:
+                return max(float(retry_after), 0)
+            except ValueError:
+                pass
+            try:
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+                return max(retry_at.timestamp() - time.time(), 0)
+            except (TypeError, ValueError):
+                pass
+        return self._wait_seconds
+
+    async def _fetch(self, method, url, headers=None, **kwargs):
+        headers = dict(headers or {})
+        if self._client_timeout is not None:
+            kwargs['timeout'] = self._client_timeout
+        entry = None
+        if method == 'GET':
+            entry = await self._getCacheEntry(url)
+            if entry is not None:
+                if entry['fresh'] or self._replay:
+                    return entry['body']
+                if entry['etag']:
+                    headers['If-None-Match'] = entry['etag']
+
         for attempt in range(self._retries):
-            response = self._client.request(method, url, **kwargs)
-            content_type = response.headers.get('Content-Type', '')
             try:
-                if ('application/vnd.api+json' not in content_type
-                        and 'application/json' not in content_type):
-                    if attempt < self._retries - 1:
-                        print(
-                            f"Warning: Unexpected Content-Type"
-                            f" '{content_type}' from Polaris."
-                            f" Retrying in {self._wait_seconds} seconds...",
-                            flush=True
+                async with self._session.request(
+                    method, url, headers=headers, **kwargs
+                ) as response:
+                    if response.status == 304 and entry is not None:
+                        await self._putCacheEntry(
+                            url, entry['body'], entry['etag']
                         )
-                        time.sleep(self._wait_seconds)
-                        continue
-                    else:
+                        return entry['body']
+                    # Error bodies must never reach the cache or the memo.
+                    # Only rate limits and server errors are worth retrying.
+                    if response.status >= 400:
+                        if (response.status != 429
+                                and response.status < 500):
+                            raise RuntimeError(
+                                f"Failed: HTTP {response.status}"
+                                f" from Polaris"
+                            )
+                        if attempt < self._retries - 1:
+                            wait_seconds = self._retryDelay(response)
+                            logger.warning(
+                                f"HTTP {response.status} from"
+                                f" Polaris. Retrying in {wait_seconds}"
+                                " seconds..."
+                            )
+                            await asyncio.sleep(wait_seconds)
+                            continue
                         raise RuntimeError(
-                            f"Failed: Unexpected Content-Type"
-                            f" '{content_type}' from Polaris after"
-                            f" {self._retries} attempts"
-                            f" (HTTP {response.status_code})"
+                            f"Failed: HTTP {response.status} from Polaris"
+                            f" after {self._retries} attempts"
                         )
-                return response.json()
-            except Exception:
+                    content_type = response.headers.get('Content-Type', '')
+                    try:
+                        if ('application/vnd.api+json' not in content_type
+                                and 'application/json' not in content_type):
+                            if attempt < self._retries - 1:
+                                logger.warning(
+                                    f"Unexpected Content-Type"
+                                    f" '{content_type}' from Polaris."
+                                    f" Retrying in {self._wait_seconds}"
+                                    " seconds..."
+                                )
+                                await asyncio.sleep(self._wait_seconds)
+                                continue
+                            else:
+                                raise RuntimeError(
+                                    f"Failed: Unexpected Content-Type"
+                                    f" '{content_type}' from Polaris after"
+                                    f" {self._retries} attempts"
+                                    f" (HTTP {response.status})"
+                                )
+                        payload = await response.json(content_type=None)
+                    except Exception:
+                        if attempt < self._retries - 1:
+                            logger.warning(
+                                f"Unexpected response from Polaris"
+                                f" (HTTP {response.status})."
+                                f" Retrying in {self._wait_seconds}"
+                                " seconds..."
+                            )
+                            await asyncio.sleep(self._wait_seconds)
+                            continue
+                        else:
+                            raise RuntimeError(
+                                f"Failed: Unexpected response from Polaris"
+                                f" after {self._retries} attempts"
+                                f" (HTTP {response.status})"
+                            )
+                    etag = response.headers.get('ETag')
+                if method == 'GET':
+                    await self._putCacheEntry(url, payload, etag)
+                return payload
+            except asyncio.TimeoutError:
                 if attempt < self._retries - 1:
-                    print(
-                        f"Warning: Unexpected response from Polaris"
-                        f" (HTTP {response.status_code})."
-                        f" Retrying in {self._wait_seconds} seconds...",
-                        flush=True
+                    logger.warning(
+                        "Request to Polaris timed out."
+                        f" Retrying in {self._wait_seconds} seconds..."
                     )
-                    time.sleep(self._wait_seconds)
+                    await asyncio.sleep(self._wait_seconds)
                 else:
-                    raise RuntimeError(
-                        f"Failed: Unexpected response from Polaris"
-                        f" after {self._retries} attempts"
-                        f" (HTTP {response.status_code})"
-                    )
+                    raise
+
+
+# Blocking facade over AsyncPolaris. It keeps one private event loop for its
+# whole lifetime so the aiohttp session (and its connection pool) is shared
+# by authentication, project listing and every issue crawl.
+class Polaris:
+    def __init__(
+            self, url, token, retries, wait_seconds, cache=None,
+            replay=False, memoize=True, request_timeout=None,
+            project_timeout=None, run_timeout=None):
+        self._polaris = AsyncPolaris(
+            url, token, retries, wait_seconds, cache=cache, replay=replay,
+            memoize=memoize, request_timeout=request_timeout,
+            project_timeout=project_timeout, run_timeout=run_timeout,
+        )
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._run(self._polaris.open())
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def __del__(self):
+        if hasattr(self, '_loop'):
+            self.close()
+
+    def _run(self, coroutine):
+        return self._loop.run_until_complete(coroutine)
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        try:
+            self._run(self._polaris.close())
+            self._run(self._loop.shutdown_asyncgens())
+        finally:
+            self._loop.close()
+
+    def getFullUrl(self, path):
+        return self._polaris.getFullUrl(path)
+
+    def getJwt(self, token):
+        return self._run(self._polaris.getJwt(token))
+
+    def GetRequestStats(self):
+        return self._polaris.GetRequestStats()
+
+    def ClearMemo(self):
+        self._polaris.ClearMemo()
+
+    def GetFailedProjects(self, filter=None):
+        return self._polaris.GetFailedProjects(filter)
+
+    def StartRun(self):
+        self._polaris.StartRun()
+
+    def GetApplication(self, application_id):
+        return self._run(self._polaris.GetApplication(application_id))
+
+    def GetProjectsFromApplication(self, application_id):
+        return self._run(
+            self._polaris.GetProjectsFromApplication(application_id)
+        )
+
+    def GetProjectsByCustomProperty(self, **kwargs):
+        return self._run(self._polaris.GetProjectsByCustomProperty(**kwargs))
+
+    def GetProjectsAndIssues(self, filter=None):
+        return self._run(self._polaris.GetProjectsAndIssues(filter))
+
+    def FormatIssueUrl(self, project_id, branch_id, revision_id, issue_id):
+        return self._polaris.FormatIssueUrl(
+            project_id, branch_id, revision_id, issue_id
+        )
+
+    def FormatProjectUrl(self, project_id, branch_id, filter):
+        return self._polaris.FormatProjectUrl(project_id, branch_id, filter)
+
+    def NormalizeIssue(self, issue, project_id, branch_id):
+        return self._polaris.NormalizeIssue(issue, project_id, branch_id)
+
+    def NormalizeIssueRelationshipValues(
+            self, normalized_data, relationship_key, value):
+        return self._polaris.NormalizeIssueRelationshipValues(
+            normalized_data, relationship_key, value
+        )
+
+    def NormalizeIssues(self, data, included, runs, project_id, branch_id):
+        return self._polaris.NormalizeIssues(
+            data, included, runs, project_id, branch_id
+        )
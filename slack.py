@@ -3,13 +3,18 @@ from slack_sdk.models.blocks import (
     SectionBlock, MarkdownTextObject, HeaderBlock, DividerBlock, TextObject
 )
 
+from aggregation import IssueAggregation
+from history import TrendArrow
+from polaris import DescribeFailedProjects
+
 
 class Slack:
     severity_colors = {
         "Audit": ":large_white_square:",
         "Low": ":large_yellow_square:",
         "Medium": ":large_orange_square:",
-        "High": ":large_red_square:"
+        "High": ":large_red_square:",
+        "Critical": ":large_purple_square:",
     }
 
     def __clearMessages(self):
@@ -35,22 +40,12 @@ class Slack:
         )
         self.__clearMessages()
 
-    def GetIssueCount(self, issues):
-        issue_counts = {}
-
-        for issue in issues:
-            if not issue['severity'] in issue_counts:
-                issue_counts[issue['severity']] = 1
-            else:
-                issue_counts[issue['severity']] += 1
-
-        return issue_counts
-
-    def SendSummaryPerProjects(self, normalized_projects, filter):
-        total_issues = 0
-
-        for project in normalized_projects:
-            total_issues += len(project['issues'])
+    def SendSummaryPerProjects(
+            self, normalized_projects, filter, aggregation=None, trend=None,
+            failed_projects=None):
+        if aggregation is None:
+            aggregation = IssueAggregation(normalized_projects)
+        total_issues = aggregation.Total()
 
         issue_descriptions = []
 
@@ -71,9 +66,9 @@ class Slack:
             )
         ))
 
-        for project in normalized_projects:
-            issues = project['issues']
-            issue_counts = self.GetIssueCount(issues)
+        for row, project in enumerate(normalized_projects):
+            issue_counts = aggregation.SeverityCounts(row)
+            project_trend = (trend or {}).get(project['project_id'], {})
 
             fields = []
             for issue_severity, issue_count in issue_counts.items():
@@ -81,6 +76,7 @@ class Slack:
                     text=(
                         f"{self.severity_colors[issue_severity]}"
                         f"{issue_severity}: {issue_count}"
+                        f"{TrendArrow(project_trend.get(issue_severity))}"
                     )
                 ))
 
@@ -94,13 +90,19 @@ class Slack:
 
             self.appendOrSend(block)
 
-        self.flush()
+        if failed_projects:
+            self.appendOrSend(SectionBlock(
+                text=MarkdownTextObject(
+                    text=DescribeFailedProjects(failed_projects)
+                )
+            ))
 
-    def SendAllIssuesInProjects(self, normalized_projects):
-        total_issues = 0
+        self.flush()
 
-        for project in normalized_projects:
-            total_issues += len(project['issues'])
+    def SendAllIssuesInProjects(self, normalized_projects, aggregation=None):
+        if aggregation is None:
+            aggregation = IssueAggregation(normalized_projects)
+        total_issues = aggregation.Total()
 
         self.appendOrSend(SectionBlock(
             text=MarkdownTextObject(
@@ -111,7 +113,7 @@ class Slack:
             )
         ))
 
-        for project in normalized_projects:
+        for row, project in enumerate(normalized_projects):
             issues = project['issues']
             self.appendOrSend(HeaderBlock(
                 text=TextObject(
@@ -119,7 +121,9 @@ class Slack:
                 )
             ))
             self.appendOrSend(SectionBlock(
-                text=MarkdownTextObject(text=f"{len(issues)} issues")
+                text=MarkdownTextObject(text=(
+                    f"{aggregation.project_totals[row]} issues"
+                ))
             ))
             last_severity = None
             last_issue_type = None
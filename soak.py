@@ -0,0 +1,489 @@
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from os import environ
+
+from aiohttp import web
+
+import main as polaris_slack
+
+SEVERITIES = ['Critical', 'High', 'Medium', 'Low', 'Audit']
+ISSUE_KINDS = ['security', 'quality']
+ISSUE_TYPES = ['SQL injection', 'Cross-site scripting', 'Null dereference']
+SUB_TOOLS = ['sast', 'sca', 'iac']
+
+# Google Chat rejects larger messages, see google.MAX_PAYLOAD_BYTES
+GOOGLE_MAX_PAYLOAD_BYTES = 32000
+SLACK_MAX_BLOCKS = 50
+
+
+# Stand-in for the Polaris API with a fixed, seeded tenant. Every request
+# except authentication can be delayed, fail with HTTP 500 or be rate
+# limited with HTTP 429.
+class MockPolaris:
+    def __init__(
+            self, projects, max_issues, latency, error_rate,
+            rate_limit_rate, seed):
+        self._max_issues = max_issues
+        self._latency = latency
+        self._error_rate = error_rate
+        self._rate_limit_rate = rate_limit_rate
+        self._seed = seed
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+        data = []
+        included = []
+        for index in range(projects):
+            data.append({
+                'id': f'project-{index}',
+                'type': 'project',
+                'attributes': {'name': f'Project {index:05d}'},
+            })
+            included.append({
+                'id': f'branch-{index}',
+                'type': 'branch',
+                'attributes': {'main-for-project': True},
+                'relationships': {
+                    'project': {
+                        'data': {'type': 'project', 'id': f'project-{index}'}
+                    },
+                },
+            })
+            included.append({
+                'id': f'run-{index}',
+                'type': 'run',
+                'attributes': {},
+                'relationships': {
+                    'revision': {
+                        'data': {'type': 'revision', 'id': f'revision-{index}'}
+                    },
+                },
+            })
+        self._projects_body = json.dumps(
+            {'data': data, 'included': included}
+        ).encode('utf-8')
+
+        self._taxons = (
+            [
+                {'id': f'severity-{i}', 'type': 'taxon',
+                 'attributes': {'name': name}}
+                for i, name in enumerate(SEVERITIES)
+            ]
+            + [
+                {'id': f'kind-{i}', 'type': 'taxon',
+                 'attributes': {'name': name}}
+                for i, name in enumerate(ISSUE_KINDS)
+            ]
+            + [
+                {'id': f'type-{i}', 'type': 'issue-type',
+                 'attributes': {'issue-type': f'type-{i}', 'name': name}}
+                for i, name in enumerate(ISSUE_TYPES)
+            ]
+        )
+
+    def Application(self):
+        application = web.Application(middlewares=[self._faults])
+        application.router.add_post(
+            '/api/auth/authenticate', self._authenticate
+        )
+        application.router.add_get('/api/common/v0/projects', self._projects)
+        application.router.add_get('/api/query/v1/issues', self._issues)
+        return application
+
+    @web.middleware
+    async def _faults(self, request, handler):
+        self.requests += 1
+        if self._latency:
+            await asyncio.sleep(self._random.uniform(0, 2 * self._latency))
+        if request.path != '/api/auth/authenticate':
+            roll = self._random.random()
+            if roll < self._error_rate:
+                self.errors += 1
+                return web.Response(
+                    status=500, text='Internal Server Error',
+                    content_type='text/html',
+                )
+            if roll < self._error_rate + self._rate_limit_rate:
+                self.rate_limited += 1
+                return web.json_response(
+                    {'errors': [{'status': '429', 'title': 'Rate limited'}]},
+                    status=429, headers={'Retry-After': '1'},
+                    content_type='application/vnd.api+json',
+                )
+        return await handler(request)
+
+    async def _authenticate(self, request):
+        return web.json_response({'jwt': 'soak'})
+
+    async def _projects(self, request):
+        return web.Response(
+            body=self._projects_body,
+            content_type='application/vnd.api+json',
+        )
+
+    def _issue(self, project, number):
+        return {
+            'id': f'issue-{project}-{number}',
+            'type': 'issue',
+            'attributes': {
+                'finding-key': f'finding-{project}-{number}',
+                'issue-key': f'key-{project}-{number}',
+                'sub-tool': SUB_TOOLS[number % len(SUB_TOOLS)],
+            },
+            'relationships': {
+                'severity': {'data': {
+                    'type': 'taxon',
+                    'id': f'severity-{number % len(SEVERITIES)}',
+                }},
+                'issue-kind': {'data': {
+                    'type': 'taxon',
+                    'id': f'kind-{number % len(ISSUE_KINDS)}',
+                }},
+                'issue-type': {'data': {
+                    'type': 'issue-type',
+                    'id': f'type-{number % len(ISSUE_TYPES)}',
+                }},
+                'path': {'data': {
+                    'type': 'path', 'id': f'path-{project}-{number}',
+                }},
+                'latest-observed-on-run': {'data': {
+                    'type': 'run', 'id': f'run-{project}',
+                }},
+                'transitions': {'data': []},
+            },
+        }
+
+    def _path(self, project, number):
+        return {
+            'id': f'path-{project}-{number}',
+            'type': 'path',
+            'attributes': {
+                'path': ['src', f'module{project}', f'file{number}.py'],
+                'path-type': 'unknown',
+            },
+        }
+
+    async def _issues(self, request):
+        project = int(request.query['project-id'].rsplit('-', 1)[1])
+        limit = int(request.query['page[limit]'])
+        offset = int(request.query['page[offset]'])
+
+        total = random.Random(f'{self._seed}-{project}').randint(
+            0, self._max_issues
+        )
+        if 'filter[issue][triage-status][$eq]' in request.query:
+            total //= 2
+
+        numbers = range(offset, min(offset + limit, total))
+        return web.json_response(
+            {
+                'data': [self._issue(project, n) for n in numbers],
+                'included': (
+                    self._taxons + [self._path(project, n) for n in numbers]
+                ),
+                'meta': {'total': total, 'limit': limit, 'offset': offset},
+            },
+            content_type='application/vnd.api+json',
+        )
+
+
+# Stand-ins for the Slack and Google Chat incoming webhooks. They reject
+# messages over the real services' limits.
+class FakeWebhooks:
+    def __init__(self):
+        self.slack_messages = 0
+        self.google_messages = 0
+        self.rejected = 0
+
+    def SlackApplication(self):
+        application = web.Application()
+        application.router.add_post('/', self._slack)
+        return application
+
+    def GoogleApplication(self):
+        application = web.Application()
+        application.router.add_post('/', self._google)
+        return application
+
+    async def _slack(self, request):
+        payload = await request.json()
+        if len(payload.get('blocks', [])) > SLACK_MAX_BLOCKS:
+            self.rejected += 1
+            return web.Response(status=400, text='invalid_blocks')
+        self.slack_messages += 1
+        return web.Response(text='ok')
+
+    async def _google(self, request):
+        body = await request.read()
+        if len(body) > GOOGLE_MAX_PAYLOAD_BYTES:
+            self.rejected += 1
+            return web.json_response(
+                {'error': {'code': 400, 'message': 'Message too large'}},
+                status=400,
+            )
+        self.google_messages += 1
+        return web.json_response({'name': 'spaces/soak/messages/soak'})
+
+
+# Serves the stand-ins from a background thread with its own event loop, so
+# main() can run unchanged in the foreground.
+class Servers:
+    def __init__(self, applications):
+        self._applications = applications
+        self._runners = []
+        self._loop = asyncio.new_event_loop()
+        self._thread = None
+        self._error = None
+        self.urls = []
+
+    def Start(self):
+        ready = threading.Event()
+        self._thread = threading.Thread(
+            target=self._serve, args=(ready,), daemon=True
+        )
+        self._thread.start()
+        ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _serve(self, ready):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._startSites())
+        except Exception as e:
+            self._error = e
+            return
+        finally:
+            ready.set()
+        self._loop.run_forever()
+
+    async def _startSites(self):
+        for application in self._applications:
+            runner = web.AppRunner(application)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = runner.addresses[0][1]
+            self._runners.append(runner)
+            self.urls.append(f'http://127.0.0.1:{port}/')
+
+    def OpenConnections(self):
+        return sum(len(runner.server.connections) for runner in self._runners)
+
+    def Stop(self):
+        async def cleanup():
+            for runner in self._runners:
+                await runner.cleanup()
+
+        asyncio.run_coroutine_threadsafe(cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def OpenFileDescriptors():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+def RunCycle(polaris_url, sink, sink_url, retries):
+    for name in (
+            'SLACK_WEBHOOK_URL', 'GOOGLE_SPACES_URL', 'POLARIS_CACHE_DIR',
+            'POLARIS_HISTORY_DB', 'POLARIS_EXPORT_FORMAT',
+            'POLARIS_ROLLUP_FILE'):
+        environ.pop(name, None)
+    environ.update({
+        'POLARIS_URL': polaris_url,
+        'POLARIS_TOKEN': 'soak',
+        'POLARIS_RETRIES': str(retries),
+        'POLARIS_WAIT_SECONDS': '0',
+        'SEND_BOTH_ISSUES_AND_UNTRIAGED_AT_ONCE_TO_SLACK': 'true',
+    })
+    if sink == 'slack':
+        environ['SLACK_WEBHOOK_URL'] = sink_url
+    else:
+        environ['GOOGLE_SPACES_URL'] = sink_url
+
+    sys.argv = ['main.py']
+    start = time.perf_counter()
+    # Progress output of every project would drown the soak report
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        try:
+            polaris_slack.main()
+            status = 0
+        except SystemExit as e:
+            status = e.code or 0
+    return status, time.perf_counter() - start
+
+
+def ParseArguments():
+    parser = argparse.ArgumentParser(
+        description="Soak test main.py against local Polaris, Slack and"
+                    " Google Chat stand-ins"
+    )
+    parser.add_argument('--projects', type=int, default=10000)
+    parser.add_argument('--max-issues', type=int, default=20,
+                        help="issues per project are drawn from 0..N")
+    parser.add_argument('--cycles', type=int, default=10)
+    parser.add_argument('--duration', type=float,
+                        help="keep cycling for this many seconds instead"
+                             " of --cycles")
+    parser.add_argument('--warmup', type=int, default=2,
+                        help="cycles before the memory and throughput"
+                             " baselines are taken")
+    parser.add_argument('--sink', choices=['slack', 'google', 'both'],
+                        default='both')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help="mean Polaris latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.01)
+    parser.add_argument('--retries', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-memory-growth-mb', type=float, default=5)
+    parser.add_argument('--no-tracemalloc', action='store_true',
+                        help="skip the memory check, tracemalloc slows"
+                             " every cycle down several times")
+    parser.add_argument('--max-throughput-drop', type=float, default=0.25,
+                        help="allowed drop of projects/s against the first"
+                             " cycle after warmup")
+    return parser.parse_args()
+
+
+def main():
+    arguments = ParseArguments()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    polaris = MockPolaris(
+        arguments.projects, arguments.max_issues, arguments.latency,
+        arguments.error_rate, arguments.rate_limit_rate, arguments.seed,
+    )
+    webhooks = FakeWebhooks()
+    servers = Servers([
+        polaris.Application(),
+        webhooks.SlackApplication(),
+        webhooks.GoogleApplication(),
+    ])
+    servers.Start()
+    polaris_url, slack_url, google_url = servers.urls
+
+    if not arguments.no_tracemalloc:
+        tracemalloc.start()
+    problems = []
+    memory_baseline = None
+    # Slack and Google cycles differ in cost, so each sink has a baseline
+    throughput_baselines = {}
+    descriptors_baseline = None
+    started = time.monotonic()
+    cycle = 0
+
+    try:
+        while True:
+            if arguments.duration is not None:
+                if time.monotonic() - started >= arguments.duration:
+                    break
+            elif cycle >= arguments.cycles:
+                break
+
+            if arguments.sink == 'both':
+                sink = 'slack' if cycle % 2 == 0 else 'google'
+            else:
+                sink = arguments.sink
+            sink_url = slack_url if sink == 'slack' else google_url
+
+            status, seconds = RunCycle(
+                polaris_url, sink, sink_url, arguments.retries
+            )
+            # Let the stand-ins notice closed connections before counting
+            time.sleep(0.2)
+            gc.collect()
+            memory, _ = tracemalloc.get_traced_memory()
+            memory_text = (
+                "memory unchecked" if arguments.no_tracemalloc
+                else f"memory {memory / 2**20:.1f}MB"
+            )
+            connections = servers.OpenConnections()
+            descriptors = OpenFileDescriptors()
+            throughput = arguments.projects / seconds
+
+            print(
+                f"cycle {cycle} ({sink}): exit {status}, {seconds:.1f}s,"
+                f" {throughput:.0f} projects/s,"
+                f" {memory_text},"
+                f" open connections {connections},"
+                f" file descriptors {descriptors}",
+                flush=True
+            )
+
+            if status not in (0, polaris_slack.EXIT_INCOMPLETE):
+                problems.append(f"cycle {cycle} exited with {status}")
+            if connections:
+                problems.append(
+                    f"cycle {cycle} left {connections} connections open"
+                )
+
+            if cycle >= arguments.warmup:
+                throughput_baseline = throughput_baselines.setdefault(
+                    sink, throughput
+                )
+                if throughput < throughput_baseline * (
+                        1 - arguments.max_throughput_drop):
+                    problems.append(
+                        f"cycle {cycle} throughput {throughput:.0f}"
+                        f" projects/s is below the {sink} baseline"
+                        f" {throughput_baseline:.0f}"
+                    )
+
+            if cycle == arguments.warmup:
+                memory_baseline = memory
+                descriptors_baseline = descriptors
+            elif cycle > arguments.warmup:
+                growth = (memory - memory_baseline) / 2**20
+                if growth > arguments.max_memory_growth_mb:
+                    problems.append(
+                        f"cycle {cycle} memory grew {growth:.1f}MB"
+                        " since warmup"
+                    )
+                if (descriptors is not None
+                        and descriptors > descriptors_baseline):
+                    problems.append(
+                        f"cycle {cycle} has {descriptors} open file"
+                        f" descriptors, {descriptors_baseline} after warmup"
+                    )
+            cycle += 1
+    finally:
+        servers.Stop()
+        tracemalloc.stop()
+
+    print(
+        f"Polaris requests {polaris.requests}, injected errors"
+        f" {polaris.errors}, rate limited {polaris.rate_limited}."
+        f" Slack messages {webhooks.slack_messages}, Google messages"
+        f" {webhooks.google_messages}, rejected {webhooks.rejected}."
+    )
+    if webhooks.rejected:
+        problems.append(f"{webhooks.rejected} webhook messages rejected")
+    if cycle <= arguments.warmup:
+        problems.append("no cycles ran after warmup")
+
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()